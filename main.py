@@ -7,17 +7,41 @@ Provides visual effects listing, image/video generation, polling, and media disp
 import asyncio
 import base64
 import json
+import logging
 import os
-import re
-import time
-from typing import Any
+import random
+import sys
+from typing import Annotated, Any
 from urllib.parse import urlparse
 
 import httpx
+from pydantic import BaseModel, Field, TypeAdapter
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent, ImageContent
 
+# Optional SIMD-accelerated base64 (several-fold faster on large images)
+try:
+    import pybase64 as _b64
+except ImportError:
+    _b64 = base64
+
+# Optional fast JSON codec (Rust); falls back to stdlib
+try:
+    import orjson
+
+    def json_loads(raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+except ImportError:
+    def json_loads(raw: bytes) -> Any:
+        return json.loads(raw)
+
+    def json_dumps(obj: Any) -> str:
+        return json.dumps(obj, indent=2)
+
 # Eternal AI API Configuration
 ETERNAL_AI_API_BASE = os.environ.get("ETERNAL_AI_API_BASE", "https://open.eternalai.org")
 VISUAL_EFFECTS_ENDPOINT = "/uncensored-ai/effects"  # GET /uncensored-ai/effects
@@ -25,12 +49,64 @@ GENERATE_EFFECT_ENDPOINT = "/generate"  # POST /generate
 GENERATE_CUSTOM_ENDPOINT = "/base/generate"  # POST /base/generate
 POLL_RESULT_ENDPOINT = "/poll-result"  # GET /poll-result/{request_id}
 
+# Largest image display_media will download and inline as base64;
+# anything bigger (or of undeclared size) is returned as a markdown link
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
 # Initialize MCP Server
 server = Server("eternal-ai-mcp")
 
+# Diagnostics must go to stderr: stdout is the MCP transport channel
+logger = logging.getLogger("eternal_ai_mcp")
+
 # Store API key (set via environment or passed in tool calls)
 _api_key: str | None = None
 
+# Shared HTTP client (created in main(), reused by all handlers for connection pooling)
+_client: httpx.AsyncClient | None = None
+
+# Cap concurrent outbound API calls so client fan-out can't thrash the upstream API
+_api_sem = asyncio.Semaphore(int(os.environ.get("ETERNAL_AI_MAX_CONCURRENCY", "10")))
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create the shared HTTP client with a keep-alive connection pool"""
+    return httpx.AsyncClient(
+        base_url=ETERNAL_AI_API_BASE,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        http2=True,
+    )
+
+
+# Status codes worth retrying: rate limiting and transient upstream errors
+_RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+_MAX_ATTEMPTS = 4
+
+
+async def request_with_retry(method: str, url: str, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client, retrying 429/5xx responses
+    with jittered exponential backoff. Honors Retry-After when present.
+    """
+    kwargs.setdefault("headers", get_api_headers())
+    client = _client
+    for attempt in range(_MAX_ATTEMPTS):
+        async with _api_sem:
+            response = await client.request(method, url, **kwargs)
+
+        if response.status_code not in _RETRYABLE_STATUS or attempt == _MAX_ATTEMPTS - 1:
+            return response
+
+        retry_after = response.headers.get("retry-after", "")
+        if retry_after.isdigit():
+            delay = float(retry_after)
+        else:
+            delay = random.uniform(0, 2 ** attempt)
+        await asyncio.sleep(delay)
+
+    return response
+
 
 def get_api_key() -> str | None:
     """Get API key from environment variable"""
@@ -46,110 +122,128 @@ def set_api_key(key: str):
     _api_key = key
 
 
-@server.list_tools()
-async def list_tools() -> list[Tool]:
-    """List available tools"""
-    return [
-        # Tool 1: get_visual_effects
-        Tool(
-            name="get_visual_effects",
-            description="Get a list of available visual effects for content generation. Filter by type (image/video) and paginate through results.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "effect_type": {
-                        "type": "string",
-                        "description": "Filter by effect type: 'image' or 'video'",
-                        "enum": ["image", "video"]
-                    },
-                    "page": {
-                        "type": "integer",
-                        "description": "Page number for pagination (default: 1)",
-                        "default": 1
-                    }
-                }
-            }
-        ),
-        # Tool 2: generate_with_effect
-        Tool(
-            name="generate_with_effect",
-            description="Generate image or video content using a specific visual effect. Returns a request_id for polling the result. Requires Authentication via Bearer token (set ETERNAL_AI_API_KEY environment variable).",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "images": {
-                        "type": "array",
-                        "description": "Array of image URLs or Base64 encoded images",
-                        "items": {
-                            "type": "string"
-                        }
-                    },
-                    "effect_id": {
-                        "type": "string",
-                        "description": "The ID of the visual effect to apply"
-                    }
+# Default API headers, rebuilt only when the key changes (see get_api_headers)
+_api_headers: dict[str, str] = {}
+
+
+def get_api_headers() -> dict[str, str]:
+    """Get default headers for API calls, cached per API key"""
+    global _api_headers
+    api_key = get_api_key()
+    if _api_headers.get("x-api-key") != api_key:
+        _api_headers = {"x-api-key": api_key} if api_key else {}
+    return _api_headers
+
+
+# Tool definitions are static per process; build them once at import time
+# instead of reconstructing the schema dicts on every list_tools call
+_TOOLS_CACHE = [
+    # Tool 1: get_visual_effects
+    Tool(
+        name="get_visual_effects",
+        description="Get a list of available visual effects for content generation. Filter by type (image/video) and paginate through results.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "effect_type": {
+                    "type": "string",
+                    "description": "Filter by effect type: 'image' or 'video'",
+                    "enum": ["image", "video"]
                 },
-                "required": ["effect_id"]
+                "page": {
+                    "type": "integer",
+                    "description": "Page number for pagination (default: 1)",
+                    "default": 1
+                }
             }
-        ),
-        # Tool 3: generate_custom_advanced
-        Tool(
-            name="generate_custom_advanced",
-            description="Generate custom image or video content using advanced prompts. Returns a request_id for polling the result. Requires Authentication via Bearer token (set ETERNAL_AI_API_KEY environment variable).",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "images": {
-                        "type": "array",
-                        "description": "Array of image URLs or Base64 encoded images",
-                        "items": {
-                            "type": "string"
-                        }
-                    },
-                    "prompt": {
-                        "type": "string",
-                        "description": "Custom text prompt describing the desired output"
-                    },
-                    "type": {
-                        "type": "string",
-                        "description": "Output type: 'image' or 'video'",
-                        "enum": ["image", "video"]
+        }
+    ),
+    # Tool 2: generate_with_effect
+    Tool(
+        name="generate_with_effect",
+        description="Generate image or video content using a specific visual effect. Returns a request_id for polling the result. Requires Authentication via Bearer token (set ETERNAL_AI_API_KEY environment variable).",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "images": {
+                    "type": "array",
+                    "description": "Array of image URLs or Base64 encoded images",
+                    "items": {
+                        "type": "string"
                     }
                 },
-                "required": ["prompt", "type"]
-            }
-        ),
-        # Tool 4: smart_poll_result
-        Tool(
-            name="smart_poll_result",
-            description="Smart polling tool that automatically checks the status of a generation task. Polls every 15s for up to 120s total. Returns final result or progress if still processing. Requires Authentication via Bearer token.\nTip for smart polling: In the video generation task, you should call this tool multiple times to get the latest progress.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "request_id": {
-                        "type": "string",
-                        "description": "The request ID returned from a generate call"
+                "effect_id": {
+                    "type": "string",
+                    "description": "The ID of the visual effect to apply"
+                }
+            },
+            "required": ["effect_id"]
+        }
+    ),
+    # Tool 3: generate_custom_advanced
+    Tool(
+        name="generate_custom_advanced",
+        description="Generate custom image or video content using advanced prompts. Returns a request_id for polling the result. Requires Authentication via Bearer token (set ETERNAL_AI_API_KEY environment variable).",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "images": {
+                    "type": "array",
+                    "description": "Array of image URLs or Base64 encoded images",
+                    "items": {
+                        "type": "string"
                     }
                 },
-                "required": ["request_id"]
-            }
-        ),
-        # Tool 5: display_media
-        Tool(
-            name="display_media",
-            description="Render media (image or video) from a URL in markdown format for display. Supports images (jpg, png, gif, webp) and videos (mp4, webm, mov). For images, downloads and returns as base64 for inline display.",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "url": {
-                        "type": "string",
-                        "description": "Media URL to render (must be http or https)"
-                    }
+                "prompt": {
+                    "type": "string",
+                    "description": "Custom text prompt describing the desired output"
                 },
-                "required": ["url"]
-            }
-        )
-    ]
+                "type": {
+                    "type": "string",
+                    "description": "Output type: 'image' or 'video'",
+                    "enum": ["image", "video"]
+                }
+            },
+            "required": ["prompt", "type"]
+        }
+    ),
+    # Tool 4: smart_poll_result
+    Tool(
+        name="smart_poll_result",
+        description="Smart polling tool that automatically checks the status of a generation task. Polls with exponential backoff for up to 120s total. Returns final result or progress if still processing. Requires Authentication via Bearer token.\nTip for smart polling: In the video generation task, you should call this tool multiple times to get the latest progress.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "request_id": {
+                    "type": "string",
+                    "description": "The request ID returned from a generate call"
+                }
+            },
+            "required": ["request_id"]
+        }
+    ),
+    # Tool 5: display_media
+    Tool(
+        name="display_media",
+        description="Render media (image or video) from a URL in markdown format for display. Supports images (jpg, png, gif, webp) and videos (mp4, webm, mov). For images, downloads and returns as base64 for inline display.",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "url": {
+                    "type": "string",
+                    "description": "Media URL to render (must be http or https)"
+                }
+            },
+            "required": ["url"]
+        }
+    )
+]
+
+
+@server.list_tools()
+async def list_tools() -> list[Tool]:
+    """List available tools"""
+    return _TOOLS_CACHE
 
 
 @server.call_tool()
@@ -183,27 +277,21 @@ async def handle_get_visual_effects(arguments: dict[str, Any]) -> list[TextConte
     if page > 0:
         params["page"] = page
 
-    headers = {}
-    api_key = get_api_key()
-    if api_key:
-        headers["x-api-key"] = api_key
+    try:
+        response = await request_with_retry(
+            "GET",
+            VISUAL_EFFECTS_ENDPOINT,
+            params=params
+        )
+        response.raise_for_status()
+        data = json_loads(response.content)
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.get(
-                f"{ETERNAL_AI_API_BASE}{VISUAL_EFFECTS_ENDPOINT}",
-                params=params,
-                headers=headers
-            )
-            response.raise_for_status()
-            data = response.json()
+        return [TextContent(type="text", text=json_dumps(data))]
 
-            return [TextContent(type="text", text=json.dumps(data, indent=2))]
-
-        except httpx.HTTPStatusError as e:
-            return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
-        except httpx.RequestError as e:
-            return [TextContent(type="text", text=f"Request Error: {str(e)}")]
+    except httpx.HTTPStatusError as e:
+        return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
+    except httpx.RequestError as e:
+        return [TextContent(type="text", text=f"Request Error: {str(e)}")]
 
 
 async def handle_generate_with_effect(arguments: dict[str, Any]) -> list[TextContent]:
@@ -222,12 +310,7 @@ async def handle_generate_with_effect(arguments: dict[str, Any]) -> list[TextCon
     if not effect_id:
         return [TextContent(type="text", text="Effect ID is required")]
 
-    images = arguments.get("images", [])
-
-    headers = {
-        "x-api-key": api_key,
-        "Content-Type": "application/json"
-    }
+    images = arguments.get("images")
 
     payload = {
         "effect_id": effect_id
@@ -235,24 +318,23 @@ async def handle_generate_with_effect(arguments: dict[str, Any]) -> list[TextCon
     if images:
         payload["images"] = images
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            response = await client.post(
-                f"{ETERNAL_AI_API_BASE}{GENERATE_EFFECT_ENDPOINT}",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            data = response.json()
+    try:
+        response = await request_with_retry(
+            "POST",
+            GENERATE_EFFECT_ENDPOINT,
+            json=payload
+        )
+        response.raise_for_status()
+        data = json_loads(response.content)
 
-            # Parse response (supports both simple and nested formats)
-            result = parse_generate_response(data)
-            return [TextContent(type="text", text=json.dumps(result, indent=2))]
+        # Parse response (supports both simple and nested formats)
+        result = parse_generate_response(data)
+        return [TextContent(type="text", text=json_dumps(result))]
 
-        except httpx.HTTPStatusError as e:
-            return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
-        except httpx.RequestError as e:
-            return [TextContent(type="text", text=f"Request Error: {str(e)}")]
+    except httpx.HTTPStatusError as e:
+        return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
+    except httpx.RequestError as e:
+        return [TextContent(type="text", text=f"Request Error: {str(e)}")]
 
 
 async def handle_generate_custom_advanced(arguments: dict[str, Any]) -> list[TextContent]:
@@ -275,12 +357,7 @@ async def handle_generate_custom_advanced(arguments: dict[str, Any]) -> list[Tex
     if not output_type:
         return [TextContent(type="text", text="Type is required (image or video)")]
 
-    images = arguments.get("images", [])
-
-    headers = {
-        "x-api-key": api_key,
-        "Content-Type": "application/json"
-    }
+    images = arguments.get("images")
 
     payload = {
         "prompt": prompt,
@@ -289,31 +366,30 @@ async def handle_generate_custom_advanced(arguments: dict[str, Any]) -> list[Tex
     if images:
         payload["images"] = images
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        try:
-            response = await client.post(
-                f"{ETERNAL_AI_API_BASE}{GENERATE_CUSTOM_ENDPOINT}",
-                headers=headers,
-                json=payload
-            )
-            response.raise_for_status()
-            data = response.json()
+    try:
+        response = await request_with_retry(
+            "POST",
+            GENERATE_CUSTOM_ENDPOINT,
+            json=payload
+        )
+        response.raise_for_status()
+        data = json_loads(response.content)
 
-            # Parse response (supports both simple and nested formats)
-            result = parse_generate_response(data)
-            return [TextContent(type="text", text=json.dumps(result, indent=2))]
+        # Parse response (supports both simple and nested formats)
+        result = parse_generate_response(data)
+        return [TextContent(type="text", text=json_dumps(result))]
 
-        except httpx.HTTPStatusError as e:
-            return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
-        except httpx.RequestError as e:
-            return [TextContent(type="text", text=f"Request Error: {str(e)}")]
+    except httpx.HTTPStatusError as e:
+        return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
+    except httpx.RequestError as e:
+        return [TextContent(type="text", text=f"Request Error: {str(e)}")]
 
 
 async def handle_smart_poll_result(arguments: dict[str, Any]) -> list[TextContent]:
     """
-    Smart polling with automatic retry.
-    - Initial delay: 30 seconds
-    - Poll interval: 15 seconds
+    Smart polling with exponential backoff and full jitter.
+    - First poll happens immediately (fast tasks return right away)
+    - Backoff: 2s base, doubled per attempt, capped at 30s
     - Max duration: 120 seconds
     API endpoint: GET /poll-result/{request_id}
     """
@@ -328,67 +404,75 @@ async def handle_smart_poll_result(arguments: dict[str, Any]) -> list[TextConten
     if not request_id:
         return [TextContent(type="text", text="Request ID is required")]
 
-    headers = {
-        "x-api-key": api_key
-    }
+    # Use the event loop's monotonic clock; wall-clock jumps (NTP, DST)
+    # must not produce bogus timeouts
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    max_duration = 120  # seconds
+    base_delay = 2  # seconds
+    max_delay = 30  # seconds
+    attempt = 0
 
-    # Step 1: Initial delay of 30 seconds
-    print(f"[MCP] [smart_poll_result] Waiting 30 seconds before first poll for request_id: {request_id}")
-    await asyncio.sleep(30)
+    while True:
+        elapsed = loop.time() - start_time
 
-    start_time = time.time()
-    max_duration = 120  # seconds
-    poll_interval = 15  # seconds
+        try:
+            response = await request_with_retry(
+                "GET",
+                f"{POLL_RESULT_ENDPOINT}/{request_id}"
+            )
+            response.raise_for_status()
+            data = json_loads(response.content)
+
+            status = str(data.get("status", "")).lower()
+            progress = data.get("progress", 0)
+
+            # Check if completed - surface the raw body unchanged rather than
+            # re-serializing what we just parsed
+            if status == "success" or status == "completed":
+                logger.info("[smart_poll_result] Task completed successfully")
+                return [TextContent(type="text", text=response.text)]
+
+            if status == "failed" or status == "error":
+                logger.info("[smart_poll_result] Task failed")
+                return [TextContent(type="text", text=response.text)]
+
+            logger.info("[smart_poll_result] Still processing (progress: %s%%)...", progress)
+
+            # Check timeout
+            if elapsed >= max_duration:
+                logger.info("[smart_poll_result] Timeout reached after %ss", max_duration)
+                timeout_response = {
+                    "request_id": data.get("request_id", request_id),
+                    "status": data.get("status", "pending"),
+                    "progress": progress,
+                    "result_url": data.get("result_url", ""),
+                    "effect_type": data.get("effect_type", ""),
+                    "message": "Task is still processing, please call this tool again"
+                }
+                return [TextContent(type="text", text=json_dumps(timeout_response))]
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        while True:
-            elapsed = time.time() - start_time
+            # Exponential backoff, capped by the remaining time budget
+            delay = min(max_delay, base_delay * 2 ** attempt, max_duration - elapsed)
+            attempt += 1
 
-            try:
-                response = await client.get(
-                    f"{ETERNAL_AI_API_BASE}{POLL_RESULT_ENDPOINT}/{request_id}",
-                    headers=headers
-                )
-                response.raise_for_status()
-                data = response.json()
-
-                status = str(data.get("status", "")).lower()
-                progress = data.get("progress", 0)
-
-                # Check if completed
-                if status == "success" or status == "completed":
-                    print(f"[MCP] [smart_poll_result] Task completed successfully")
-                    return [TextContent(type="text", text=json.dumps(data, indent=2))]
-
-                if status == "failed" or status == "error":
-                    print(f"[MCP] [smart_poll_result] Task failed")
-                    return [TextContent(type="text", text=json.dumps(data, indent=2))]
-
-                print(f"[MCP] [smart_poll_result] Still processing (progress: {progress}%)...")
-
-                # Check timeout
-                if elapsed >= max_duration:
-                    print(f"[MCP] [smart_poll_result] Timeout reached after {max_duration}s")
-                    timeout_response = {
-                        "request_id": data.get("request_id", request_id),
-                        "status": data.get("status", "pending"),
-                        "progress": progress,
-                        "result_url": data.get("result_url", ""),
-                        "effect_type": data.get("effect_type", ""),
-                        "message": "Task is still processing, please call this tool again"
-                    }
-                    return [TextContent(type="text", text=json.dumps(timeout_response, indent=2))]
+            # Poll sooner when reported progress suggests the task is almost done
+            if progress:
+                estimate = elapsed / progress * (100 - progress)
+                delay = min(delay, max(estimate, base_delay))
 
-                # Wait before next poll
-                await asyncio.sleep(poll_interval)
+            # Full jitter so concurrent pollers don't synchronize
+            await asyncio.sleep(random.uniform(0, delay))
 
-            except httpx.HTTPStatusError as e:
-                return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
-            except httpx.RequestError as e:
-                print(f"[MCP] [smart_poll_result] Poll error (will retry): {e}")
-                if elapsed >= max_duration:
-                    return [TextContent(type="text", text=f"Request Error after timeout: {str(e)}")]
-                await asyncio.sleep(poll_interval)
+        except httpx.HTTPStatusError as e:
+            return [TextContent(type="text", text=f"API Error: {e.response.status_code} - {e.response.text}")]
+        except httpx.RequestError as e:
+            logger.warning("[smart_poll_result] Poll error (will retry): %s", e)
+            if elapsed >= max_duration:
+                return [TextContent(type="text", text=f"Request Error after timeout: {str(e)}")]
+            delay = min(max_delay, base_delay * 2 ** attempt, max_duration - elapsed)
+            attempt += 1
+            await asyncio.sleep(random.uniform(0, delay))
 
 
 async def handle_display_media(arguments: dict[str, Any]) -> list[TextContent | ImageContent]:
@@ -407,18 +491,37 @@ async def handle_display_media(arguments: dict[str, Any]) -> list[TextContent |
     if parsed.scheme not in ("http", "https"):
         return [TextContent(type="text", text="URL must use http or https protocol")]
 
-    # Detect media type
-    url_lower = url.lower()
-    mime_type = detect_mime_type(url_lower)
+    # Detect media type from the already-parsed path (skips query/fragment)
+    mime_type = detect_mime_type(parsed.path)
 
     # Handle images
     if mime_type.startswith("image/"):
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                response = await client.get(url)
+        client = _client
+        try:
+            # Encode while streaming: 48 KiB chunks are a multiple of 3 bytes,
+            # so each chunk base64-encodes independently with no padding state
+            # and the raw image is never held in memory alongside its encoding
+            encoded = bytearray()
+            inline = True
+            async with client.stream("GET", url) as response:
                 response.raise_for_status()
 
-                image_data = base64.b64encode(response.content).decode("utf-8")
+                # Only inline downloads that declare a sane size, and keep
+                # enforcing the cap while streaming in case the header lies
+                declared = response.headers.get("content-length")
+                if declared is None or not declared.isdigit() or int(declared) > MAX_IMAGE_BYTES:
+                    inline = False
+                else:
+                    total = 0
+                    async for chunk in response.aiter_bytes(chunk_size=48 * 1024):
+                        total += len(chunk)
+                        if total > MAX_IMAGE_BYTES:
+                            inline = False
+                            break
+                        encoded += _b64.b64encode(chunk)
+
+            if inline:
+                image_data = encoded.decode("ascii")
 
                 return [ImageContent(
                     type="image",
@@ -426,79 +529,108 @@ async def handle_display_media(arguments: dict[str, Any]) -> list[TextContent |
                     mimeType=mime_type
                 )]
 
-            except httpx.HTTPStatusError as e:
-                return [TextContent(type="text", text=f"Failed to download image: {e.response.status_code}")]
-            except httpx.RequestError as e:
-                return [TextContent(type="text", text=f"Failed to download image: {str(e)}")]
+            # Oversized or unsized image: fall through to the markdown link
+
+        except httpx.HTTPStatusError as e:
+            return [TextContent(type="text", text=f"Failed to download image: {e.response.status_code}")]
+        except httpx.RequestError as e:
+            return [TextContent(type="text", text=f"Failed to download image: {str(e)}")]
 
     # Handle videos and other media - return as markdown
     markdown = f"![Media]({url})\n\nMedia URL: {url}"
     return [TextContent(type="text", text=markdown)]
 
 
-def parse_generate_response(data: dict) -> dict:
-    """
-    Parse generate response - supports both simple and nested formats.
-    Simple: {"request_id": "...", "status": "...", "result": "...", "progress": 0}
-    Nested: {"status": 1, "data": {...}, "request_id": "..."}
-    """
-    # Check if nested format (has "data" field with dict value)
-    if "data" in data and isinstance(data.get("data"), dict):
-        nested_data = data["data"]
+class SimpleGenerateResponse(BaseModel):
+    """Flat format: {"request_id": "...", "status": "...", "result": "...", "progress": 0}"""
+    request_id: Any = ""
+    status: Any = ""
+    result: Any = ""
+    progress: Any = 0
+
+    def to_dict(self) -> dict:
         return {
-            "request_id": nested_data.get("request_id", data.get("request_id", "")),
-            "status": nested_data.get("status", ""),
-            "result": nested_data.get("result", ""),
-            "progress": nested_data.get("progress", 0),
-            "status_code": data.get("status")
+            "request_id": self.request_id,
+            "status": self.status,
+            "result": self.result,
+            "progress": self.progress
         }
 
-    # Simple format
-    return {
-        "request_id": data.get("request_id", ""),
-        "status": data.get("status", ""),
-        "result": data.get("result", ""),
-        "progress": data.get("progress", 0)
-    }
 
+class NestedGenerateResponse(BaseModel):
+    """Nested format: {"status": 1, "data": {...}, "request_id": "..."}"""
+    data: SimpleGenerateResponse
+    request_id: Any = ""
+    status: Any = None
 
-def detect_mime_type(url_lower: str) -> str:
-    """Detect MIME type from URL extension"""
-    if url_lower.endswith((".jpg", ".jpeg")):
-        return "image/jpeg"
-    elif url_lower.endswith(".png"):
-        return "image/png"
-    elif url_lower.endswith(".gif"):
-        return "image/gif"
-    elif url_lower.endswith(".webp"):
-        return "image/webp"
-    elif url_lower.endswith(".bmp"):
-        return "image/bmp"
-    elif url_lower.endswith(".svg"):
-        return "image/svg+xml"
-    elif url_lower.endswith(".mp4"):
-        return "video/mp4"
-    elif url_lower.endswith(".webm"):
-        return "video/webm"
-    elif url_lower.endswith(".mov"):
-        return "video/quicktime"
-    elif url_lower.endswith(".avi"):
-        return "video/x-msvideo"
-    elif url_lower.endswith(".mkv"):
-        return "video/x-matroska"
-    else:
-        return "application/octet-stream"
+    def to_dict(self) -> dict:
+        inner = self.data
+        return {
+            "request_id": inner.request_id or self.request_id,
+            "status": inner.status,
+            "result": inner.result,
+            "progress": inner.progress,
+            "status_code": self.status
+        }
+
+
+# Nested first - it is the stricter shape (requires a dict "data" field),
+# so anything without one falls through to the flat format
+_GENERATE_RESPONSE_ADAPTER = TypeAdapter(
+    Annotated[
+        NestedGenerateResponse | SimpleGenerateResponse,
+        Field(union_mode="left_to_right"),
+    ]
+)
+
+
+def parse_generate_response(data: dict) -> dict:
+    """Parse generate response - supports both simple and nested formats"""
+    return _GENERATE_RESPONSE_ADAPTER.validate_python(data).to_dict()
+
+
+# Extension -> MIME type lookup for detect_mime_type
+_MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".bmp": "image/bmp",
+    ".svg": "image/svg+xml",
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+    ".mkv": "video/x-matroska",
+}
+
+
+def detect_mime_type(path: str) -> str:
+    """Detect MIME type from the extension of a URL path"""
+    ext = os.path.splitext(path)[1].lower()
+    return _MIME_TYPES.get(ext, "application/octet-stream")
 
 
 async def main():
     """Run the MCP server with stdio transport"""
+    global _client
     async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            server.create_initialization_options()
-        )
+        _client = create_http_client()
+        try:
+            await server.run(
+                read_stream,
+                write_stream,
+                server.create_initialization_options()
+            )
+        finally:
+            await _client.aclose()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        stream=sys.stderr,
+        format="[MCP] %(message)s"
+    )
     asyncio.run(main())